@@ -60,6 +60,10 @@ logger = logging.getLogger(__name__)
 # FIXME: Updated constants.TYPE_ERROR to use this clearer format from wehjit:
 TYPE_ERROR = '%s: need a %r; got a %r: %r'
 
+LOG_LOGGER_LEVEL_RE = re.compile(
+    r'^log_logger_level_(debug|info|warn|warning|error|critical|\d+)$')
+LOG_LOGGER_REGEXPS_SEPARATOR_RE = re.compile(r'\s*,\s*')
+
 
 # FIXME: This function has no unit test
 def find_modules_in_dir(src_dir):
@@ -110,13 +114,12 @@ class Registry:
             if not callable(plugin):
                 raise TypeError('plugin must be callable; got %r' % plugin)
 
-            # Raise DuplicateError if this exact class was already registered:
-            if plugin in self.__registry:
+            # Add to __registry, or raise DuplicateError if this exact class
+            # was already registered:
+            entry = dict(kwargs, plugin=plugin)
+            if self.__registry.setdefault(plugin, entry) is not entry:
                 raise errors.PluginDuplicateError(plugin=plugin)
 
-            # The plugin is okay, add to __registry:
-            self.__registry[plugin] = dict(kwargs, plugin=plugin)
-
             return plugin
 
         return register
@@ -340,10 +343,12 @@ class APINameSpace(Mapping):
         return six.itervalues(self)
 
     def __getattr__(self, key):
+        self.__enumerate()
         try:
-            return self[key]
+            plugin = self.__plugins_by_key[key]
         except KeyError:
             raise AttributeError(key)
+        return self.__api._get(plugin)
 
 
 class API(ReadOnly):
@@ -387,7 +392,7 @@ class API(ReadOnly):
 
         :param name: The plugin namespace name to test for membership.
         """
-        return name in set(self)
+        return any(base.__name__ == name for base in self.bases)
 
     def __getitem__(self, name):
         """
@@ -461,16 +466,14 @@ class API(ReadOnly):
         root_logger.setLevel(level)
 
         for attr in self.env:
-            match = re.match(r'^log_logger_level_'
-                             r'(debug|info|warn|warning|error|critical|\d+)$',
-                             attr)
+            match = LOG_LOGGER_LEVEL_RE.match(attr)
             if not match:
                 continue
 
             level = ipa_log_manager.convert_log_level(match.group(1))
 
             value = getattr(self.env, attr)
-            regexps = re.split(r'\s*,\s*', value)
+            regexps = LOG_LOGGER_REGEXPS_SEPARATOR_RE.split(value)
 
             # Add the regexp, it maps to the configured level
             for regexp in regexps:
@@ -593,15 +596,8 @@ class API(ReadOnly):
         if options.env is not None:
             assert type(options.env) is list
             for item in options.env:
-                try:
-                    values = item.split('=', 1)
-                except ValueError:
-                    # FIXME: this should raise an IPA exception with an
-                    # error code.
-                    # --Jason, 2008-10-31
-                    pass
-                if len(values) == 2:
-                    (key, value) = values
+                (key, sep, value) = item.partition('=')
+                if sep:
                     overrides[str(key.strip())] = value.strip()
                 else:
                     raise errors.OptionError(_('Unable to parse option {item}'
@@ -757,8 +753,11 @@ class API(ReadOnly):
                 logger.info(
                     "IPA_CONFDIR env sets confdir to '%s'.", self.env.confdir)
 
+        validate_api = self.env.validate_api
+        plugins_on_demand = self.env.plugins_on_demand
+
         for plugin in self.__plugins:
-            if not self.env.validate_api:
+            if not validate_api:
                 if plugin.full_name not in DEFAULT_PLUGINS:
                     continue
             else:
@@ -778,13 +777,14 @@ class API(ReadOnly):
 
         production_mode = self.is_production_mode()
 
-        for base in self.bases:
+        # add_plugin() only accepts plugins with a base in self.bases, so
+        # every plugin belongs to at least one namespace; instantiate each
+        # of them once instead of re-scanning all plugins for every base.
+        if not plugins_on_demand:
             for plugin in self.__plugins:
-                if not any(issubclass(b, base) for b in plugin.bases):
-                    continue
-                if not self.env.plugins_on_demand:
-                    self._get(plugin)
+                self._get(plugin)
 
+        for base in self.bases:
             name = base.__name__
             if not production_mode:
                 assert not hasattr(self, name)
@@ -793,7 +793,7 @@ class API(ReadOnly):
         for instance in six.itervalues(self.__instances):
             if not production_mode:
                 assert instance.api is self
-            if not self.env.plugins_on_demand:
+            if not plugins_on_demand:
                 instance.ensure_finalized()
                 if not production_mode:
                     assert islocked(instance)
@@ -802,16 +802,19 @@ class API(ReadOnly):
             lock(self)
 
     def _get(self, plugin):
+        # Fast path: only plugins that passed the checks below are
+        # instantiated, so a cached instance needs no further validation.
+        try:
+            return self.__instances[plugin]
+        except KeyError:
+            pass
+
         if not callable(plugin):
             raise TypeError('plugin must be callable; got %r' % plugin)
         if plugin not in self.__plugins:
             raise KeyError(plugin)
 
-        try:
-            instance = self.__instances[plugin]
-        except KeyError:
-            instance = self.__instances[plugin] = plugin(self)
-
+        instance = self.__instances[plugin] = plugin(self)
         return instance
 
     def get_plugin_next(self, plugin):
@@ -57,31 +57,38 @@ class common_smart_card_auth_config(Advice):
         # Newer version of sssd use OpenSSL and read the CA certs
         # from /etc/sssd/pki/sssd_auth_ca_db.pem
         self.log.command('mkdir -p /etc/sssd/pki')
+        # Generate a single UUID and number the CA nicknames from it instead
+        # of running uuidgen for every certificate
+        self.log.command('SC_CA_BASE=$(uuidgen)')
+        self.log.command('SC_CA_IDX=0')
         with self.log.for_loop(
                 self.single_ca_cert_variable_name,
                 '${}'.format(self.smart_card_ca_certs_variable_name)):
+            self.log.command('SC_CA_IDX=$((SC_CA_IDX+1))')
             self.log.command(
-                'certutil -d {} -A -i ${} -n "Smart Card CA $(uuidgen)" '
+                'certutil -d {} -A -i ${} '
+                '-n "Smart Card CA ${{SC_CA_BASE}}-${{SC_CA_IDX}}" '
                 '-t CT,C,C'.format(
                     self.systemwide_nssdb, self.single_ca_cert_variable_name
                 )
             )
-            self.log.command(
-                'cat ${} >>  /etc/sssd/pki/sssd_auth_ca_db.pem'.format(
-                    self.single_ca_cert_variable_name
-                )
+        # Append all the CA certificates with a single cat call,
+        # relying on the same word splitting as the loop above
+        self.log.command(
+            'cat -- ${} >> /etc/sssd/pki/sssd_auth_ca_db.pem'.format(
+                self.smart_card_ca_certs_variable_name
             )
+        )
 
     def install_smart_card_signing_ca_certs(self):
-        with self.log.for_loop(
-                self.single_ca_cert_variable_name,
-                '${}'.format(self.smart_card_ca_certs_variable_name)):
-            self.log.exit_on_failed_command(
-                'ipa-cacert-manage install ${} -t CT,C,C'.format(
-                    self.single_ca_cert_variable_name
-                ),
-                ['Failed to install external CA certificate to IPA']
-            )
+        # ipa-cacert-manage install accepts several files at once, install
+        # all the CA certificates with a single invocation
+        self.log.exit_on_failed_command(
+            'ipa-cacert-manage install ${} -t CT,C,C'.format(
+                self.smart_card_ca_certs_variable_name
+            ),
+            ['Failed to install external CA certificate to IPA']
+        )
 
     def update_ipa_ca_certificate_store(self):
         self.log.exit_on_failed_command(
@@ -104,11 +111,25 @@ class config_server_for_smart_card_auth(common_smart_card_auth_config):
 
     ssl_conf = paths.HTTPD_SSL_CONF
     ssl_ocsp_directive = OCSP_DIRECTIVE
+    # the commands only depend on the two constants above, format them once
+    ssl_ocsp_present_predicate = "grep -q '{directive} ' {filename}".format(
+        directive=ssl_ocsp_directive, filename=ssl_conf)
+    ssl_ocsp_switch_on_command = (
+        "sed -i.ipabkp -r "
+        "'s/^#*[[:space:]]*{directive}[[:space:]]+(on|off)$"
+        "/{directive} on/' {filename}").format(
+            directive=ssl_ocsp_directive, filename=ssl_conf)
+    ssl_ocsp_insert_command = (
+        r"sed -i.ipabkp '/<\/VirtualHost>/i {directive} on' "
+        r"{filename}").format(
+            directive=ssl_ocsp_directive, filename=ssl_conf)
     kdc_service_name = services.knownservices.krb5kdc.systemd_name
     httpd_service_name = services.knownservices.httpd.systemd_name
+    hostname_variable_name = 'IPA_HOSTNAME'
 
     def get_info(self):
         self.log.exit_on_nonroot_euid()
+        self.set_hostname_variable()
         self.check_and_set_ca_cert_paths()
         self.check_ccache_not_empty()
         self.check_hostname_is_in_masters()
@@ -124,10 +145,15 @@ class config_server_for_smart_card_auth(common_smart_card_auth_config):
         self.update_ipa_ca_certificate_store()
         self.restart_kdc()
 
+    def set_hostname_variable(self):
+        self.log.comment('Resolve the FQDN of the host only once')
+        self.log.command(
+            '{}=$(hostname -f)'.format(self.hostname_variable_name))
+
     def check_hostname_is_in_masters(self):
         self.log.comment('Check whether the host is IPA master')
         self.log.exit_on_failed_command(
-            'ipa server-find $(hostname -f)',
+            'ipa server-find "${}"'.format(self.hostname_variable_name),
             ["This script can be run on IPA master only"])
 
     def resolve_ipaca_records(self):
@@ -143,7 +169,9 @@ class config_server_for_smart_card_auth(common_smart_card_auth_config):
         self.log.comment('make sure ipa-ca records are resolvable, '
                          'otherwise error out and instruct')
         self.log.comment('the user to update the DNS infrastructure')
-        self.log.command('ipaca_records=$(dig +short '
+        self.log.comment('do not wait for the default 3x5 seconds if the '
+                         'resolver does not answer')
+        self.log.command('ipaca_records=$(dig +short +timeout=2 +tries=2 '
                          'ipa-ca.{})'.format(ipa_domain_name))
 
         self.log.exit_on_predicate(
@@ -159,30 +187,15 @@ class config_server_for_smart_card_auth(common_smart_card_auth_config):
         self.log.comment(' if it is present, switch it on')
         self.log.comment(
             'if it is absent, append it to the end of VirtualHost section')
-        predicate = self._interpolate_ocsp_directive_file_into_command(
-            "grep -q '{directive} ' {filename}")
-
-        self.log.commands_on_predicate(
-            predicate,
-            [
-                self._interpolate_ocsp_directive_file_into_command(
-                    "sed -i.ipabkp -r "
-                    "'s/^#*[[:space:]]*{directive}[[:space:]]+(on|off)$"
-                    "/{directive} on/' {filename}")
-            ],
-            commands_to_run_when_false=[
-                self._interpolate_ocsp_directive_file_into_command(
-                    r"sed -i.ipabkp '/<\/VirtualHost>/i {directive} on' "
-                    r"{filename}")
-            ]
-        )
+        error_message_lines = [
+            'Failed to enable OCSP in {}'.format(self.ssl_conf)]
 
-    def _interpolate_ocsp_directive_file_into_command(self, fmt_line):
-        return self._format_command(
-            fmt_line, self.ssl_ocsp_directive, self.ssl_conf)
-
-    def _format_command(self, fmt_line, directive, filename):
-        return fmt_line.format(directive=directive, filename=filename)
+        with self.log.if_branch(self.ssl_ocsp_present_predicate):
+            self.log.exit_on_failed_command(
+                self.ssl_ocsp_switch_on_command, error_message_lines)
+        with self.log.else_branch():
+            self.log.exit_on_failed_command(
+                self.ssl_ocsp_insert_command, error_message_lines)
 
     def restart_httpd(self):
         self.log.comment('finally restart apache')
@@ -199,8 +212,12 @@ class config_server_for_smart_card_auth(common_smart_card_auth_config):
 
     def check_and_enable_pkinit(self):
         self.log.comment('check whether PKINIT is configured on the master')
+        # ipa-pkinit-manage status exits with 0 in both cases, match its
+        # output with a shell parameter expansion instead of piping to grep
+        self.log.command('PKINIT_STATUS=$(ipa-pkinit-manage status)')
         with self.log.if_branch(
-                "ipa-pkinit-manage status | grep -q 'enabled'"):
+                '[ "${PKINIT_STATUS#*PKINIT is enabled}" != '
+                '"$PKINIT_STATUS" ]'):
             self.log.command('echo "PKINIT already enabled"')
         with self.log.else_branch():
             self.log.exit_on_failed_command(
@@ -211,8 +228,9 @@ class config_server_for_smart_card_auth(common_smart_card_auth_config):
         self.log.comment('Enable OK-AS-DELEGATE flag on the HTTP principal')
         self.log.comment('This enables smart card login to WebUI')
         self.log.command(
-            'output=$(ipa service-mod HTTP/$(hostname -f) '
-            '--ok-to-auth-as-delegate=True 2>&1)')
+            'output=$(ipa service-mod HTTP/"${}" '
+            '--ok-to-auth-as-delegate=True 2>&1)'.format(
+                self.hostname_variable_name))
         self.log.exit_on_predicate(
             '[ "$?" -ne "0" -a '
             '-z "$(echo $output | grep \'no modifications\')" ]',
@@ -256,6 +274,7 @@ class config_client_for_smart_card_auth(common_smart_card_auth_config):
     pkcs11_shared_lib = '/usr/lib64/opensc-pkcs11.so'
     smart_card_service_file = 'pcscd.service'
     smart_card_socket = 'pcscd.socket'
+    python3_variable_name = 'PYTHON3CMD'
 
     def get_info(self):
         self.log.exit_on_nonroot_euid()
@@ -268,6 +287,7 @@ class config_client_for_smart_card_auth(common_smart_card_auth_config):
         self.add_pkcs11_module_to_systemwide_db()
         self.upload_smartcard_ca_certificates_to_systemwide_db()
         self.update_ipa_ca_certificate_store()
+        self.set_python3_command()
         self.run_authselect_to_configure_smart_card_auth()
         self.configure_pam_cert_auth()
         self.restart_sssd()
@@ -305,9 +325,10 @@ class config_client_for_smart_card_auth(common_smart_card_auth_config):
         nssdb = self.systemwide_nssdb
         shared_lib = self.pkcs11_shared_lib
 
+        # Ask p11-kit first, it does not need to open the NSS database
         self.log.commands_on_predicate(
-            'modutil -dbdir {nssdb} -list | grep -q {module_name} || '
-            'p11-kit list-modules | grep -i {module_name} -q'.format(
+            'p11-kit list-modules 2>/dev/null | grep -qi {module_name} || '
+            'modutil -dbdir {nssdb} -list | grep -q {module_name}'.format(
                 nssdb=nssdb, module_name=module_name),
             [
                 'echo "{} PKCS#11 module already configured"'.format(
@@ -339,24 +360,28 @@ class config_client_for_smart_card_auth(common_smart_card_auth_config):
             ]
         )
 
-    def configure_pam_cert_auth(self):
-        self.log.comment('Set pam_cert_auth=True in /etc/sssd/sssd.conf')
-        self.log.comment('This step is required only when authselect is used')
+    def set_python3_command(self):
         # If the advise command is run on RHEL7 or fedora but the client
         # is rhel8, python3 executable may be in a different location
-        # Find the right python path first
-        self.log.command("python3 --version >/dev/null 2>&1")
+        # Find the right python path once for the whole script
+        python3_variable = self.python3_variable_name
+
+        self.log.comment('Find the python3 interpreter')
         self.log.commands_on_predicate(
-            '[ "$?" -eq 0 ]',
-            ['PYTHON3CMD=python3'],
-            ['PYTHON3CMD=/usr/libexec/platform-python']
+            'python3 --version >/dev/null 2>&1',
+            ['{}=python3'.format(python3_variable)],
+            ['{}=/usr/libexec/platform-python'.format(python3_variable)]
         )
+
+    def configure_pam_cert_auth(self):
+        self.log.comment('Set pam_cert_auth=True in /etc/sssd/sssd.conf')
+        self.log.comment('This step is required only when authselect is used')
         self.log.commands_on_predicate(
             '[ -f {} ]'.format(paths.AUTHSELECT),
-            ["${PYTHON3CMD} -c 'from SSSDConfig import SSSDConfig; "
+            ["${} -c 'from SSSDConfig import SSSDConfig; "
              "c = SSSDConfig(); c.import_config(); "
              "c.set(\"pam\", \"pam_cert_auth\", \"True\"); "
-             "c.write()'"])
+             "c.write()'".format(self.python3_variable_name)])
 
     def restart_sssd(self):
         self.log.command('systemctl restart sssd.service')
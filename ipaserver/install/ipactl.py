@@ -19,9 +19,12 @@
 
 from __future__ import print_function
 
+import functools
+import operator
 import sys
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 import ldapurl
 
@@ -45,13 +48,35 @@ MSG_HINT_IGNORE_SERVICE_FAILURE = (
     "case that a non-critical service failed"
 )
 
+# upper bound of concurrent service status probes in ipa_status()
+MAX_STATUS_WORKERS = 16
+
+DSE_ERRORLOG_LEVEL = b"nsslapd-errorlog-level"
+
+# ipaConfigString value prefix carrying a service's start order
+START_ORDER_PREFIX = "startOrder "
+
+# LDAP service entry CN -> systemd service name
+SERVICE_SYSTEMD_NAMES = {
+    cn: svc.systemd_name for cn, svc in service.SERVICE_LIST.items()
+}
+
+# platform Directory Server service handle, shared by all ipactl commands
+DIRSRV = services.knownservices.dirsrv
+
 
 class IpactlError(ScriptError):
     pass
 
 
+@functools.lru_cache(maxsize=None)
+def is_ipa_configured_cached():
+    """Return is_ipa_configured(), checked at most once per process."""
+    return is_ipa_configured()
+
+
 def check_IPA_configuration():
-    if not is_ipa_configured():
+    if not is_ipa_configured_cached():
         # LSB status code 6: program is not configured
         raise IpactlError(
             "IPA is not configured "
@@ -62,42 +87,39 @@ def check_IPA_configuration():
 
 def deduplicate(lst):
     """Remove duplicates and preserve order.
-    Returns copy of list with preserved order and removed duplicates.
+    Returns list of the items of iterable lst with preserved order and
+    removed duplicates.
     """
-    new_lst = []
-    s = set(lst)
-    for i in lst:
-        if i in s:
-            s.remove(i)
-            new_lst.append(i)
-
-    return new_lst
+    return list(dict.fromkeys(lst))
 
 
+@functools.lru_cache(maxsize=None)
 def is_dirsrv_debugging_enabled():
     """
     Check the 389-ds instance to see if debugging is enabled.
     If so we suppress that in our output.
 
+    The result is cached, dse.ldif is only read once per ipactl run.
+
     returns True or False
     """
-    debugging = False
     serverid = realm_to_serverid(api.env.realm)
     dselist = [config_dirname(serverid)]
     for dse in dselist:
         try:
-            fd = open(dse + "dse.ldif", "r")
+            fd = open(dse + "dse.ldif", "rb")
         except IOError:
             continue
-        lines = fd.readlines()
-        fd.close()
-        for line in lines:
-            if line.lower().startswith("nsslapd-errorlog-level"):
-                _option, value = line.split(":")
-                if int(value) > 0:
-                    debugging = True
+        with fd:
+            for line in fd:
+                # LDIF attribute names are case-insensitive
+                attr = line[:len(DSE_ERRORLOG_LEVEL)].lower()
+                if attr == DSE_ERRORLOG_LEVEL:
+                    _option, value = line.split(b":")
+                    if int(value) > 0:
+                        return True
 
-    return debugging
+    return False
 
 
 def get_capture_output(service, debug):
@@ -105,6 +127,9 @@ def get_capture_output(service, debug):
     We want to display any output of a start/stop command with the
     exception of 389-ds when debugging is enabled because it outputs
     tons and tons of information.
+
+    Only dirsrv is affected, the services from SERVICE_LIST are always
+    started with output displayed.
     """
     if service == "dirsrv" and not debug and is_dirsrv_debugging_enabled():
         print("    debugging enabled, suppressing output.")
@@ -150,13 +175,12 @@ def parse_options():
     )
 
     options, args = parser.parse_args()
-    safe_options = parser.get_safe_opts(options)
 
     if options.force:
         options.ignore_service_failures = True
         options.skip_version_check = True
 
-    return safe_options, options, args
+    return options, args
 
 
 def emit_err(err):
@@ -197,6 +221,35 @@ def version_check():
         raise IpactlError("Aborting ipactl")
 
 
+def get_masters_list(con):
+    """
+    Get the newline separated list of master CNs for error reporting.
+
+    Only used when the local host has no service entries, so the extra
+    LDAP search is kept off the common path.
+
+    :param con: bound LDAPClient to search with
+    """
+    masters_list = []
+    dn = DN(
+        ("cn", "masters"), ("cn", "ipa"), ("cn", "etc"), api.env.basedn
+    )
+    attrs = ["cn"]
+    try:
+        entries = con.get_entries(
+            dn, con.SCOPE_ONELEVEL, attrs_list=attrs
+        )
+    except Exception as e:
+        masters_list.append(
+            "No master found because of error: %s" % str(e)
+        )
+    else:
+        for master_entry in entries:
+            masters_list.append(master_entry.single_value["cn"])
+
+    return "\n".join(masters_list)
+
+
 def get_config(dirsrv):
     base = DN(
         ("cn", api.env.host),
@@ -254,25 +307,7 @@ def get_config(dirsrv):
             3,
         )
     except errors.NotFound:
-        masters_list = []
-        dn = DN(
-            ("cn", "masters"), ("cn", "ipa"), ("cn", "etc"), api.env.basedn
-        )
-        attrs = ["cn"]
-        try:
-            entries = con.get_entries(
-                dn, con.SCOPE_ONELEVEL, attrs_list=attrs
-            )
-        except Exception as e:
-            masters_list.append(
-                "No master found because of error: %s" % str(e)
-            )
-        else:
-            for master_entry in entries:
-                masters_list.append(master_entry.single_value["cn"])
-
-        masters = "\n".join(masters_list)
-
+        masters = get_masters_list(con)
         raise IpactlError(
             "Failed to get list of services to probe status!\n"
             "Configured hostname '%s' does not match any master server in "
@@ -289,21 +324,27 @@ def get_config(dirsrv):
 
     for entry in res:
         name = entry.single_value["cn"]
-        for p in entry["ipaConfigString"]:
-            if p.startswith("startOrder "):
-                try:
-                    order = int(p.split()[1])
-                except ValueError:
-                    raise IpactlError(
-                        "Expected order as integer in: %s:%s" % (name, p)
-                    )
+        order_str = next(
+            (
+                p for p in entry["ipaConfigString"]
+                if p.startswith(START_ORDER_PREFIX)
+            ),
+            None,
+        )
+        if order_str is None:
+            continue
+        try:
+            order = int(order_str.split()[1])
+        except ValueError:
+            raise IpactlError(
+                "Expected order as integer in: %s:%s" % (name, order_str)
+            )
         svc_list.append([order, name])
 
-    ordered_list = []
-    for order, svc in sorted(svc_list):
-        if svc in service.SERVICE_LIST:
-            ordered_list.append(service.SERVICE_LIST[svc].systemd_name)
-    return deduplicate(ordered_list)
+    # systemd names are never empty, filter() only drops unknown services
+    return deduplicate(filter(None, (
+        SERVICE_SYSTEMD_NAMES.get(svc) for _order, svc in sorted(svc_list)
+    )))
 
 
 def get_config_from_file(rval):
@@ -316,8 +357,8 @@ def get_config_from_file(rval):
     svc_list = []
 
     try:
-        f = open(tasks.get_svc_list_file(), "r")
-        svc_list = json.load(f)
+        with open(tasks.get_svc_list_file(), "r") as f:
+            svc_list = json.load(f)
     except Exception as e:
         raise IpactlError(
             "Unknown error when retrieving list of services from file: %s"
@@ -329,17 +370,15 @@ def get_config_from_file(rval):
     # authoritative for, so filter the list through SERVICES_LIST and order it
     # accordingly too.
 
-    def_svc_list = []
-    for svc in service.SERVICE_LIST:
-        s = service.SERVICE_LIST[svc]
-        def_svc_list.append([s[1], s[0]])
-
-    ordered_list = []
-    for _order, svc in sorted(def_svc_list):
-        if svc in svc_list:
-            ordered_list.append(svc)
-
-    return deduplicate(ordered_list)
+    svc_set = set(svc_list)
+    return deduplicate(
+        s.systemd_name
+        for s in sorted(
+            service.SERVICE_LIST.values(),
+            key=operator.attrgetter("startorder"),
+        )
+        if s.systemd_name in svc_set
+    )
 
 
 def stop_services(svc_list):
@@ -375,23 +414,22 @@ def ipa_start(options):
         # service file again
         os.unlink(paths.SVC_LIST_FILE)
 
-    dirsrv = services.knownservices.dirsrv
     try:
         print("Starting Directory Service")
-        dirsrv.start(
+        DIRSRV.start(
             capture_output=get_capture_output("dirsrv", options.debug)
         )
     except Exception as e:
         raise IpactlError("Failed to start Directory Service: " + str(e))
 
     try:
-        svc_list = get_config(dirsrv)
+        svc_list = get_config(DIRSRV)
     except Exception as e:
         emit_err("Failed to read data from service file: " + str(e))
         emit_err("Shutting down")
 
         if not options.ignore_service_failures:
-            stop_dirsrv(dirsrv)
+            stop_dirsrv(DIRSRV)
 
         if isinstance(e, IpactlError):
             # do not display any other error message
@@ -407,9 +445,7 @@ def ipa_start(options):
         svchandle = services.service(svc, api=api)
         try:
             print("Starting %s Service" % svc)
-            svchandle.start(
-                capture_output=get_capture_output(svc, options.debug)
-            )
+            svchandle.start(capture_output=False)
         except Exception:
             emit_err("Failed to start %s Service" % svc)
             # if ignore_service_failures is specified, skip rollback and
@@ -424,28 +460,27 @@ def ipa_start(options):
 
             emit_err("Shutting down")
             stop_services(svc_list)
-            stop_dirsrv(dirsrv)
+            stop_dirsrv(DIRSRV)
 
             emit_err(MSG_HINT_IGNORE_SERVICE_FAILURE)
             raise IpactlError("Aborting ipactl")
 
 
 def ipa_stop(options):
-    dirsrv = services.knownservices.dirsrv
     try:
         svc_list = get_config_from_file(rval=4)
     except Exception as e:
         # Issue reading the file ? Let's try to get data from LDAP as a
         # fallback
         try:
-            dirsrv.start(capture_output=False)
-            svc_list = get_config(dirsrv)
+            DIRSRV.start(capture_output=False)
+            svc_list = get_config(DIRSRV)
         except Exception as e:
             emit_err("Failed to read data from Directory Service: " + str(e))
             emit_err("Shutting down")
             try:
                 # just try to stop it, do not read a result
-                dirsrv.stop()
+                DIRSRV.stop()
             finally:
                 raise IpactlError()
 
@@ -459,7 +494,7 @@ def ipa_stop(options):
 
     try:
         print("Stopping Directory Service")
-        dirsrv.stop(capture_output=False)
+        DIRSRV.stop(capture_output=False)
     except Exception:
         raise IpactlError("Failed to stop Directory Service")
 
@@ -485,13 +520,12 @@ def ipa_restart(options):
     else:
         print("Skipping version check")
 
-    dirsrv = services.knownservices.dirsrv
     new_svc_list = []
     dirsrv_restart = True
-    if not dirsrv.is_running():
+    if not DIRSRV.is_running():
         try:
             print("Starting Directory Service")
-            dirsrv.start(
+            DIRSRV.start(
                 capture_output=get_capture_output("dirsrv", options.debug)
             )
             dirsrv_restart = False
@@ -499,12 +533,12 @@ def ipa_restart(options):
             raise IpactlError("Failed to start Directory Service: " + str(e))
 
     try:
-        new_svc_list = get_config(dirsrv)
+        new_svc_list = get_config(DIRSRV)
     except Exception as e:
         emit_err("Failed to read data from Directory Service: " + str(e))
         emit_err("Shutting down")
         try:
-            dirsrv.stop(capture_output=False)
+            DIRSRV.stop(capture_output=False)
         except Exception:
             pass
         if isinstance(e, IpactlError):
@@ -522,18 +556,12 @@ def ipa_restart(options):
         old_svc_list = new_svc_list
 
     # match service to start/stop
-    svc_list = []
-    for s in new_svc_list:
-        if s in old_svc_list:
-            svc_list.append(s)
+    common_svcs = set(new_svc_list) & set(old_svc_list)
+    svc_list = [s for s in new_svc_list if s in common_svcs]
 
     # remove commons
-    for s in svc_list:
-        if s in old_svc_list:
-            old_svc_list.remove(s)
-    for s in svc_list:
-        if s in new_svc_list:
-            new_svc_list.remove(s)
+    old_svc_list = [s for s in old_svc_list if s not in common_svcs]
+    new_svc_list = [s for s in new_svc_list if s not in common_svcs]
 
     if len(old_svc_list) != 0:
         # we need to definitely stop some services
@@ -548,7 +576,7 @@ def ipa_restart(options):
     try:
         if dirsrv_restart:
             print("Restarting Directory Service")
-            dirsrv.restart(
+            DIRSRV.restart(
                 capture_output=get_capture_output("dirsrv", options.debug)
             )
     except Exception as e:
@@ -557,7 +585,7 @@ def ipa_restart(options):
 
         if not options.ignore_service_failures:
             stop_services(reversed(svc_list))
-            stop_dirsrv(dirsrv)
+            stop_dirsrv(DIRSRV)
 
         raise IpactlError("Aborting ipactl")
 
@@ -567,9 +595,7 @@ def ipa_restart(options):
             svchandle = services.service(svc, api=api)
             try:
                 print("Restarting %s Service" % svc)
-                svchandle.restart(
-                    capture_output=get_capture_output(svc, options.debug)
-                )
+                svchandle.restart(capture_output=False)
             except Exception:
                 emit_err("Failed to restart %s Service" % svc)
                 # if ignore_service_failures is specified,
@@ -584,7 +610,7 @@ def ipa_restart(options):
 
                 emit_err("Shutting down")
                 stop_services(svc_list)
-                stop_dirsrv(dirsrv)
+                stop_dirsrv(DIRSRV)
 
                 emit_err(MSG_HINT_IGNORE_SERVICE_FAILURE)
                 raise IpactlError("Aborting ipactl")
@@ -595,9 +621,7 @@ def ipa_restart(options):
             svchandle = services.service(svc, api=api)
             try:
                 print("Starting %s Service" % svc)
-                svchandle.start(
-                    capture_output=get_capture_output(svc, options.debug)
-                )
+                svchandle.start(capture_output=False)
             except Exception:
                 emit_err("Failed to start %s Service" % svc)
                 # if ignore_service_failures is specified, skip rollback and
@@ -612,7 +636,7 @@ def ipa_restart(options):
 
                 emit_err("Shutting down")
                 stop_services(svc_list)
-                stop_dirsrv(dirsrv)
+                stop_dirsrv(DIRSRV)
 
                 emit_err(MSG_HINT_IGNORE_SERVICE_FAILURE)
                 raise IpactlError("Aborting ipactl")
@@ -638,9 +662,8 @@ def ipa_status(options):
     socket_activated = ('ipa-ods-exporter', 'ipa-otpd',)
 
     try:
-        dirsrv = services.knownservices.dirsrv
-        if dirsrv.is_running():
-            svc_list = get_config(dirsrv)
+        if DIRSRV.is_running():
+            svc_list = get_config(DIRSRV)
         else:
             svc_list = get_config_from_file(rval=1)
     except IpactlError as e:
@@ -655,9 +678,8 @@ def ipa_status(options):
         )
 
     stopped = 0
-    dirsrv = services.knownservices.dirsrv
     try:
-        if dirsrv.is_running():
+        if DIRSRV.is_running():
             print("Directory Service: RUNNING")
         else:
             print("Directory Service: STOPPED")
@@ -674,10 +696,18 @@ def ipa_status(options):
             3,
         )
 
-    for svc in svc_list:
-        svchandle = services.service(svc, api=api)
+    # is_running() only queries systemd, so the probes can run concurrently;
+    # the results are still reported in the order of svc_list
+    svc_handles = [services.service(svc, api=api) for svc in svc_list]
+    with ThreadPoolExecutor(
+            max_workers=min(MAX_STATUS_WORKERS, len(svc_handles))) as executor:
+        svc_statuses = [
+            executor.submit(svchandle.is_running) for svchandle in svc_handles
+        ]
+
+    for svc, svc_status in zip(svc_list, svc_statuses):
         try:
-            if svchandle.is_running():
+            if svc_status.result():
                 print("%s Service: RUNNING" % svc)
             else:
                 print("%s Service: STOPPED" % svc)
@@ -695,7 +725,7 @@ def main():
         # LSB status code 4: user had insufficient privilege
         raise IpactlError("You must be root to run ipactl.", 4)
 
-    _safe_options, options, args = parse_options()
+    options, args = parse_options()
 
     if len(args) != 1:
         # LSB status code 2: invalid or excess argument(s)
@@ -214,6 +214,9 @@ class test_API(ClassChecker):
         api.finalize()
         assert api.isdone('bootstrap') is True
         assert api.isdone('finalize') is True
+        assert 'base0' in api
+        assert 'base1' in api
+        assert 'base2' not in api
 
         def get_base_name(b):
             return 'base%d' % b
@@ -343,3 +346,17 @@ class test_cli(ClassChecker):
             api.bootstrap_with_global_options(context='unit_test')
         except errors.OptionError as e:
             assert e.msg == 'Unable to parse option rbose'
+
+    def test_env_option(self):
+        sys.argv = ['/usr/bin/ipa', '-e', 'my_test_key = a=b', 'user-show']
+        api = create_api(mode='unit_test')
+        (_options, argv) = api.bootstrap_with_global_options(
+            context='unit_test')
+        assert argv == ['user-show']
+        assert api.env.my_test_key == 'a=b'
+
+    def test_env_option_invalid(self):
+        sys.argv = ['/usr/bin/ipa', '-e', 'my_test_key', 'user-show']
+        api = create_api(mode='unit_test')
+        with pytest.raises(errors.OptionError):
+            api.bootstrap_with_global_options(context='unit_test')